@@ -20,5 +20,5 @@ sys.exit(1)
 
 setup(  # type: ignore # noqa
     name="pooch-dropbox",
-    install_requires=[],
+    install_requires=["dropbox", "pooch"],
 )
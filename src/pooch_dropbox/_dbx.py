@@ -1,16 +1,23 @@
 from __future__ import annotations
 
+import json
 import os
 import tempfile
 import warnings
-from typing import TYPE_CHECKING, Iterator, cast
-
-import dropbox
-import dropbox.files
-import pooch
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, TypeVar, cast
 
 if TYPE_CHECKING:
-    from dropbox.files import ListFolderResult
+    # dropbox and pooch are slow to import, so they are imported where they're used
+    import dropbox
+    from dropbox.files import FileMetadata, ListFolderResult, Metadata
+
+_T = TypeVar("_T")
+_R = TypeVar("_R")
 
 
 def create_shared_links(
@@ -18,6 +25,8 @@ def create_shared_links(
     recursive: bool = True,
     extension: str = "",
     api_token: str | None = None,
+    max_workers: int = 8,
+    use_cache: bool = True,
 ) -> Iterator[dict]:
     """Yield a dictionary of file metadata for each file in a Dropbox folder.
 
@@ -34,8 +43,74 @@ def create_shared_links(
     api_token : str, optional
         Dropbox API token.  If not provided, will look for the
         DROPBOX_API_TOKEN environment variable.
+    max_workers : int, optional
+        Maximum number of shared links to create concurrently.  Links are created
+        as results are consumed, so no more than `max_workers` links are created
+        ahead of the caller.  Default is 8.
+    use_cache : bool, optional
+        If True, reuse shared links created by previous calls for files whose
+        content hash hasn't changed, rather than asking Dropbox for them again.
+        If False, create all links anew (e.g. if some were revoked) and replace
+        the cached ones.  Links are cached per Dropbox account, in
+        `pooch.os_cache("pooch-dropbox")`.  Default is True.
     """
-    # Authenticate with Dropbox API
+    from dropbox.files import FileMetadata
+
+    dbx = _get_client(api_token)
+
+    # Retrieve file list in the folder.  This is lazy, so shared links for the
+    # first page of results are being created while later pages are fetched.
+    entries = (
+        entry
+        for entry in _list_folder(dbx, folder_path, recursive)
+        # skip folders, and files that don't match the extension
+        if isinstance(entry, FileMetadata) and entry.name.endswith(extension)
+    )
+
+    cache_path = _links_cache_path(dbx)
+    cache = _load_json(cache_path)
+    # links are looked up in `reuse`, and all links end up in `cache`
+    reuse = cache if use_cache else {}
+
+    # create the shared links concurrently.  When rate-limited, the dropbox client
+    # waits as long as the API asks it to (Retry-After) and retries.
+    try:
+        with ThreadPoolExecutor(max_workers) as pool:
+            link_info = partial(_shared_link_info, dbx, reuse, cache)
+            yield from _lazy_map(pool, link_info, entries, max_workers)
+    finally:
+        _dump_json(cache, cache_path)
+
+
+def _lazy_map(
+    pool: ThreadPoolExecutor,
+    fn: Callable[[_T], _R],
+    items: Iterable[_T],
+    max_pending: int,
+) -> Iterator[_R]:
+    """Like `pool.map(fn, items)`, but with at most `max_pending` calls in flight.
+
+    Unlike `pool.map`, `items` is consumed lazily, and calls that haven't started
+    yet are cancelled if the returned generator is closed early.
+    """
+    iterator = iter(items)
+    pending: deque[Future[_R]] = deque(
+        pool.submit(fn, item) for item in islice(iterator, max_pending)
+    )
+    try:
+        while pending:
+            yield pending.popleft().result()
+            for item in islice(iterator, 1):
+                pending.append(pool.submit(fn, item))
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _get_client(api_token: str | None = None) -> dropbox.Dropbox:
+    """Return a Dropbox client authenticated with `api_token`."""
+    import dropbox
+
     if not api_token:
         api_token = os.getenv("DROPBOX_API_TOKEN")
     if not api_token:
@@ -43,28 +118,88 @@ def create_shared_links(
             "Please provide a api_token or set the DROPBOX_API_TOKEN "
             "environment variable"
         )
-    dbx = dropbox.Dropbox(api_token)
-
-    # Retrieve file list in the folder
-    result = dbx.files_list_folder(path=folder_path, recursive=recursive)
-
-    for entry in cast("ListFolderResult", result).entries:
-        # iterate through all file entries
-        if isinstance(entry, dropbox.files.FileMetadata):
-            # skip files that don't match the extension
-            if extension and not entry.name.endswith(extension):
-                continue
-            # create a shared link for each file
-            shared_link = dbx.sharing_create_shared_link(entry.path_lower)
-            yield {
-                "name": entry.name,
-                "last_updated": entry.client_modified.isoformat(),
-                "content_hash": entry.content_hash,
-                "path": shared_link.path,
-                "url": shared_link.url.replace("dl=0", "dl=1"),
-                "size": entry.size,
-                "public": shared_link.visibility.is_public(),
-            }
+    return dropbox.Dropbox(api_token)
+
+
+def _list_folder(
+    dbx: dropbox.Dropbox, folder_path: str, recursive: bool
+) -> Iterator[Metadata]:
+    """Yield all entries in a Dropbox folder, following pagination cursors.
+
+    Each page of results is requested in the background while the previous page is
+    being consumed.
+    """
+    result = cast(
+        "ListFolderResult",
+        dbx.files_list_folder(path=folder_path, recursive=recursive, limit=2000),
+    )
+    with ThreadPoolExecutor(1) as pool:
+        while True:
+            if result.has_more:
+                next_page = pool.submit(dbx.files_list_folder_continue, result.cursor)
+            yield from result.entries
+            if not result.has_more:
+                return
+            result = cast("ListFolderResult", next_page.result())
+
+
+def _shared_link_info(
+    dbx: dropbox.Dropbox, reuse: dict, cache: dict, entry: FileMetadata
+) -> dict:
+    """Return metadata for file `entry`, creating a shared link if necessary.
+
+    `reuse` maps lowercased dropbox paths to previously created links that may be
+    reused.  `cache` is updated with any newly created link.
+    """
+    link = reuse.get(entry.path_lower)
+    if link is None or link["content_hash"] != entry.content_hash:
+        shared_link = dbx.sharing_create_shared_link(entry.path_lower)
+        link = cache[entry.path_lower] = {
+            "content_hash": entry.content_hash,
+            "path": shared_link.path,
+            "url": shared_link.url.replace("dl=0", "dl=1"),
+            "public": shared_link.visibility.is_public(),
+        }
+    return {
+        "name": entry.name,
+        "last_updated": entry.client_modified.isoformat(),
+        "content_hash": entry.content_hash,
+        "path": link["path"],
+        "url": link["url"],
+        "size": entry.size,
+        "public": link["public"],
+    }
+
+
+def _links_cache_path(dbx: dropbox.Dropbox) -> Path:
+    """Return the path of the on-disk cache of links created by `dbx`'s account."""
+    import pooch
+
+    # account ids look like "dbid:AAH4f99T0taONIb-OurWxbNQ6ywGRopQngc"
+    account_id = dbx.users_get_current_account().account_id.replace(":", "_")
+    return Path(pooch.os_cache("pooch-dropbox"), f"links-{account_id}.json")
+
+
+def _load_json(path: Path) -> dict:
+    """Return the contents of JSON file `path`, or an empty dict if unreadable."""
+    try:
+        with open(path) as f:
+            return cast(dict, json.load(f))
+    except (OSError, ValueError):
+        return {}
+
+
+def _dump_json(obj: dict, path: Path) -> None:
+    """Atomically write `obj` to `path` as JSON."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(obj, f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
 
 
 def create_pooch_registry(
@@ -72,6 +207,10 @@ def create_pooch_registry(
     output_path: str = "registry.txt",
     extension: str = "",
     force_hash: str | None = None,
+    stream: bool = False,
+    api_token: str | None = None,
+    max_workers: int = 8,
+    use_cache: bool = True,
 ) -> None:
     """Given a dropbox folder, create a pooch registry file.
 
@@ -94,6 +233,13 @@ def create_pooch_registry(
     ...     if val == force_hash:
     ...         POOCH.registry[key] = None
 
+    To avoid downloading files again on subsequent runs, the pooch hash of each
+    file is stored next to the registry (in "<output_path stem>.sidecar.json"), keyed
+    by the Dropbox content_hash.  Only downloads that matched their content_hash are
+    stored, and files whose content_hash is already in there are not downloaded.
+    Hashes are stored as files are verified, so they are kept even if a later
+    download fails.
+
     Parameters
     ----------
     dropbox_folder : str
@@ -108,43 +254,121 @@ def create_pooch_registry(
     force_hash : str, optional
         If not null, this hash will be written to the registry file for all files.
         (See notes above for more details.)
+    stream : bool, optional
+        If True, stream files from the Dropbox API and hash them as they arrive,
+        rather than downloading them to disk with pooch.  Either way, downloads are
+        checked against the content_hash reported by Dropbox.  Default is False.
+    api_token : str, optional
+        Dropbox API token.  If not provided, will look for the
+        DROPBOX_API_TOKEN environment variable.
+    max_workers : int, optional
+        Maximum number of files to download and hash concurrently.  Default is 8.
+    use_cache : bool, optional
+        If True, reuse shared links created by previous runs.  Set to False to create
+        new links, e.g. if some were revoked.  (See `create_shared_links`.)
+        Default is True.
+    """
+    from pooch import get_logger
+
+    from ._dropbox_content_hasher import _sha256_factory
+
+    dbx = _get_client(api_token)
+    links = list(
+        create_shared_links(
+            dropbox_folder,
+            extension=extension,
+            api_token=api_token,
+            use_cache=use_cache,
+        )
+    )
+    # map of dropbox content hashes to pooch hashes, from previous runs
+    sidecar_path = Path(output_path).with_suffix(".sidecar.json")
+    known_hashes = _load_json(sidecar_path)
+    # pick the SHA-256 backend here, rather than while the pool is busy downloading
+    _sha256_factory()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            hash_link = partial(
+                _pooch_hash,
+                dbx=dbx,
+                directory=directory,
+                force_hash=force_hash,
+                stream=stream,
+                known_hashes=known_hashes,
+            )
+            with ThreadPoolExecutor(max_workers) as pool:
+                hashes = list(pool.map(hash_link, links))
+    finally:
+        _dump_json(known_hashes, sidecar_path)
+
+    lines = []
+    for link, pooch_hash in zip(links, hashes):
+        fname = link["name"]
+        url = link["url"]
 
+        if pooch_hash is None:
+            warnings.warn(
+                f"Dropbox hash for file {fname} does not not match, skipping.",
+                stacklevel=2,
+            )
+            continue
 
+        lines.append(f"{fname} {pooch_hash} {url}\n")
+
+    if force_hash:
+        get_logger().info("".join(lines).rstrip())
+    with open(output_path, "w", buffering=1 << 20) as registry:
+        registry.writelines(lines)
+
+
+def _pooch_hash(
+    link: dict,
+    dbx: dropbox.Dropbox,
+    directory: str,
+    force_hash: str | None,
+    stream: bool,
+    known_hashes: dict,
+) -> str | None:
+    """Return the registry hash for shared `link`, or None if its download is bad.
+
+    `known_hashes` maps dropbox content hashes to previously computed pooch hashes,
+    and the hash of `link` is added to it once its download has been verified.
+    See `create_pooch_registry` for a description of the other arguments.
     """
-    from pooch import get_logger
+    import pooch
+
+    from ._dropbox_content_hasher import _dual_hash
+
+    if force_hash:
+        return force_hash
+
+    if link["content_hash"] in known_hashes:
+        return cast(str, known_hashes[link["content_hash"]])
+
+    if stream:
+        dropbox_hash, pooch_hash = _download_hash(dbx, link["path"])
+    else:
+        # Download the data file to the specified directory
+        path = pooch.retrieve(url=link["url"], known_hash=None, path=directory)
+        dropbox_hash, pooch_hash = _dual_hash(path)
+    if dropbox_hash != link["content_hash"]:
+        return None
+    known_hashes[link["content_hash"]] = pooch_hash
+    return pooch_hash
+
+
+def _download_hash(dbx: dropbox.Dropbox, path: str) -> tuple[str, str]:
+    """Return the Dropbox content hash and the SHA-256 hash of Dropbox file `path`.
+
+    The file is hashed as it downloads, without being written to disk.
+    """
+    from ._dropbox_content_hasher import BLOCK_SIZE, DropboxContentHasher, _sha256
 
-    from ._dropbox_content_hasher import db_content_hash
-
-    with tempfile.TemporaryDirectory() as directory:
-        with open(output_path, "w") as registry:
-            shared_links = create_shared_links(dropbox_folder, extension=extension)
-            for link in shared_links:
-                fname = link["name"]
-                url = link["url"]
-
-                if force_hash:
-                    line = f"{fname} {force_hash} {url}"
-                    get_logger().info(line)
-                    registry.write(line + "\n")
-                    continue
-
-                # Download each data file to the specified directory
-                path = pooch.retrieve(url=url, known_hash=None, path=directory)
-
-                dropbox_hash = link["content_hash"]
-                if db_content_hash(path) != dropbox_hash:
-                    warnings.warn(
-                        f"Dropbox hash for file {fname} does not not match, skipping.",
-                        stacklevel=2,
-                    )
-                    continue
-
-                pooch_hash = pooch.file_hash(path)
-                registry.write(f"{fname} {pooch_hash} {url}\n")
-
-
-POOCH = pooch.create(path=pooch.os_cache("nd2-samples"), base_url="")
-POOCH.load_registry("registry.txt")
-for key, val in POOCH.registry.items():
-    if val in ("None", "none", "_"):
-        POOCH.registry[key] = None
+    dropbox_hasher = DropboxContentHasher()
+    file_hasher = _sha256()
+    _, response = dbx.files_download(path)
+    with response:
+        for chunk in response.iter_content(chunk_size=BLOCK_SIZE):
+            dropbox_hasher.update(chunk)
+            file_hasher.update(chunk)
+    return dropbox_hasher.hexdigest(), file_hasher.hexdigest()
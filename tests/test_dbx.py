@@ -0,0 +1,276 @@
+import datetime
+import hashlib
+import io
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Tuple
+
+import pooch
+import pytest
+from dropbox import files as dropbox_files
+
+from pooch_dropbox import (
+    _dbx,
+    create_pooch_registry,
+    create_shared_links,
+    db_content_hash,
+)
+
+FOLDER = "/data"
+
+
+class _Response:
+    def __init__(self, data: bytes) -> None:
+        self._data = data
+
+    def __enter__(self) -> "_Response":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        pass
+
+    def iter_content(self, chunk_size: int) -> Iterator[bytes]:
+        # deliberately small, unaligned chunks
+        for i in range(0, len(self._data), 3):
+            yield self._data[i : i + 3]
+
+
+class FakeDropbox:
+    """Minimal stand-in for dropbox.Dropbox, serving files from a dict."""
+
+    def __init__(self, files: Dict[str, bytes], account_id: str = "dbid:A") -> None:
+        self.files = files
+        self.account_id = account_id
+        self.page_size = 2
+        self.links_created: List[str] = []
+        self.downloads: List[str] = []
+        # downloads of these files are served this content instead
+        self.corrupt: Dict[str, bytes] = {}
+
+    def users_get_current_account(self) -> SimpleNamespace:
+        return SimpleNamespace(account_id=self.account_id)
+
+    def _page(self, start: int) -> SimpleNamespace:
+        entries = [dropbox_files.FolderMetadata(name="sub", id="id:sub")]
+        for name, data in self.files.items():
+            entries.append(
+                dropbox_files.FileMetadata(
+                    name=name,
+                    id=f"id:{name}",
+                    client_modified=datetime.datetime(2023, 1, 1),
+                    server_modified=datetime.datetime(2023, 1, 1),
+                    rev="0123456789",
+                    size=len(data),
+                    path_lower=f"{FOLDER}/{name}",
+                    content_hash=db_content_hash(io.BytesIO(data)),
+                )
+            )
+        end = start + self.page_size
+        return SimpleNamespace(
+            entries=entries[start:end], cursor=str(end), has_more=end < len(entries)
+        )
+
+    def files_list_folder(self, path: str, **kwargs: Any) -> SimpleNamespace:
+        return self._page(0)
+
+    def files_list_folder_continue(self, cursor: str) -> SimpleNamespace:
+        return self._page(int(cursor))
+
+    def sharing_create_shared_link(self, path: str) -> SimpleNamespace:
+        # links for earlier files take longer, so they finish out of order
+        names = list(self.files)
+        time.sleep(0.01 * (len(names) - names.index(path.rsplit("/", 1)[-1])))
+        self.links_created.append(path)
+        return SimpleNamespace(
+            path=path,
+            url=f"https://dropbox.test{path}?dl=0",
+            visibility=SimpleNamespace(is_public=lambda: True),
+        )
+
+    def files_download(self, path: str) -> Tuple[SimpleNamespace, _Response]:
+        self.downloads.append(path)
+        name = path.rsplit("/", 1)[-1]
+        return SimpleNamespace(), _Response(self.corrupt.get(name, self.files[name]))
+
+
+@pytest.fixture
+def files() -> Dict[str, bytes]:
+    return {f"file{i}.nd2": f"contents of file {i}".encode() for i in range(5)}
+
+
+@pytest.fixture
+def dbx(
+    files: Dict[str, bytes], tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> FakeDropbox:
+    fake = FakeDropbox(files)
+    monkeypatch.setattr(_dbx, "_get_client", lambda api_token=None: fake)
+    monkeypatch.setattr(pooch, "os_cache", lambda name: tmp_path / "cache")
+    return fake
+
+
+@pytest.fixture
+def retrieved(files: Dict[str, bytes], monkeypatch: pytest.MonkeyPatch) -> List[str]:
+    """Patch pooch.retrieve to "download" from `files`, recording each url."""
+    urls: List[str] = []
+
+    def _retrieve(url: str, known_hash: Any, path: str) -> str:
+        urls.append(url)
+        name = url.rsplit("/", 1)[-1].split("?")[0]
+        dest = Path(path, name)
+        dest.write_bytes(files[name])
+        return str(dest)
+
+    monkeypatch.setattr(pooch, "retrieve", _retrieve)
+    return urls
+
+
+def test_list_folder_pagination(dbx: FakeDropbox) -> None:
+    entries = list(_dbx._list_folder(dbx, FOLDER, recursive=True))
+    # 1 folder + 5 files, over 3 pages of 2
+    assert [e.name for e in entries] == ["sub", *dbx.files]
+
+
+def test_create_shared_links(dbx: FakeDropbox, files: Dict[str, bytes]) -> None:
+    links = list(create_shared_links(FOLDER, extension=".nd2"))
+    # in listing order, even though the links were created out of order
+    assert [link["name"] for link in links] == list(files)
+    assert dbx.links_created != [f"{FOLDER}/{name}" for name in files]
+    assert links[0]["url"] == f"https://dropbox.test{FOLDER}/file0.nd2?dl=1"
+    assert links[0]["size"] == len(files["file0.nd2"])
+
+    assert not list(create_shared_links(FOLDER, extension=".txt"))
+
+
+def test_create_shared_links_lazy(dbx: FakeDropbox, files: Dict[str, bytes]) -> None:
+    files.update({f"more{i}.nd2": b"more" for i in range(25)})
+    links = create_shared_links(FOLDER, max_workers=2)
+    assert next(links)["name"] == "file0.nd2"
+    links.close()
+    # creating a link can make a file public, so only those asked for (and the
+    # few already in flight) should be created
+    assert 1 <= len(dbx.links_created) <= 2
+
+
+def test_shared_link_cache(dbx: FakeDropbox, files: Dict[str, bytes]) -> None:
+    first = list(create_shared_links(FOLDER))
+    assert len(dbx.links_created) == len(files)
+
+    # reused while the content hash matches
+    assert list(create_shared_links(FOLDER)) == first
+    assert len(dbx.links_created) == len(files)
+
+    # recreated when it changes
+    files["file2.nd2"] = b"new contents"
+    list(create_shared_links(FOLDER))
+    assert dbx.links_created[len(files) :] == [f"{FOLDER}/file2.nd2"]
+
+    # or when the cache isn't used
+    dbx.links_created.clear()
+    list(create_shared_links(FOLDER, use_cache=False))
+    assert len(dbx.links_created) == len(files)
+
+    # and it isn't shared between accounts
+    dbx.links_created.clear()
+    dbx.account_id = "dbid:B"
+    list(create_shared_links(FOLDER))
+    assert len(dbx.links_created) == len(files)
+
+
+def test_create_pooch_registry_stream(
+    dbx: FakeDropbox, files: Dict[str, bytes], retrieved: List[str], tmp_path: Path
+) -> None:
+    registry = tmp_path / "registry.txt"
+    create_pooch_registry(FOLDER, str(registry), stream=True)
+    assert not retrieved
+    assert len(dbx.downloads) == len(files)
+    lines = registry.read_text().splitlines()
+    assert [line.split()[1] for line in lines] == [
+        hashlib.sha256(data).hexdigest() for data in files.values()
+    ]
+
+    # streamed downloads are checked against the content_hash from dropbox too
+    dbx.corrupt["file1.nd2"] = b"corrupted"
+    with pytest.warns(UserWarning, match="file1.nd2"):
+        create_pooch_registry(FOLDER, str(tmp_path / "other.txt"), stream=True)
+    lines = (tmp_path / "other.txt").read_text().splitlines()
+    names = [line.split()[0] for line in lines]
+    assert names == [name for name in files if name != "file1.nd2"]
+
+
+def test_create_pooch_registry(
+    dbx: FakeDropbox, files: Dict[str, bytes], retrieved: List[str], tmp_path: Path
+) -> None:
+    registry = tmp_path / "registry.txt"
+    create_pooch_registry(FOLDER, str(registry), max_workers=4)
+    # in listing order, whatever order the concurrent downloads finished in
+    assert registry.read_text() == "".join(
+        f"{name} {hashlib.sha256(data).hexdigest()} "
+        f"https://dropbox.test{FOLDER}/{name}?dl=1\n"
+        for name, data in files.items()
+    )
+    assert sorted(retrieved) == [
+        f"https://dropbox.test{FOLDER}/{name}?dl=1" for name in sorted(files)
+    ]
+
+
+def test_create_pooch_registry_sidecar(
+    dbx: FakeDropbox, files: Dict[str, bytes], retrieved: List[str], tmp_path: Path
+) -> None:
+    registry = tmp_path / "registry.txt"
+    create_pooch_registry(FOLDER, str(registry))
+    expected = registry.read_text()
+    assert len(retrieved) == len(files)
+
+    # the sidecar means nothing is downloaded again on a rerun
+    assert (tmp_path / "registry.sidecar.json").exists()
+    create_pooch_registry(FOLDER, str(registry))
+    assert registry.read_text() == expected
+    assert len(retrieved) == len(files)
+
+    # only new or changed files are
+    files["file2.nd2"] = b"new contents"
+    create_pooch_registry(FOLDER, str(registry))
+    assert retrieved[len(files) :] == [f"https://dropbox.test{FOLDER}/file2.nd2?dl=1"]
+
+
+def test_create_pooch_registry_sidecar_failed_download(
+    dbx: FakeDropbox,
+    retrieved: List[str],
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    registry = tmp_path / "registry.txt"
+    retrieve = pooch.retrieve
+
+    def _fail_file2(url: str, **kwargs: Any) -> str:
+        if "file2" in url:
+            raise OSError("connection reset")
+        return retrieve(url, **kwargs)
+
+    monkeypatch.setattr(pooch, "retrieve", _fail_file2)
+    with pytest.raises(OSError, match="connection reset"):
+        create_pooch_registry(FOLDER, str(registry), max_workers=1)
+    assert retrieved[:2] == [
+        f"https://dropbox.test{FOLDER}/file{i}.nd2?dl=1" for i in range(2)
+    ]
+
+    # files verified before the failure aren't downloaded again
+    monkeypatch.setattr(pooch, "retrieve", retrieve)
+    retrieved.clear()
+    create_pooch_registry(FOLDER, str(registry))
+    assert f"https://dropbox.test{FOLDER}/file2.nd2?dl=1" in retrieved
+    assert not any("file0" in url or "file1" in url for url in retrieved)
+
+
+def test_create_pooch_registry_hash_mismatch(
+    dbx: FakeDropbox, files: Dict[str, bytes], retrieved: List[str], tmp_path: Path
+) -> None:
+    registry = tmp_path / "registry.txt"
+    dbx.corrupt["file1.nd2"] = b"corrupted"
+    with pytest.warns(UserWarning, match="file1.nd2"):
+        create_pooch_registry(FOLDER, str(registry), stream=True)
+
+    # a download that didn't match isn't recorded, so it is downloaded next time
+    create_pooch_registry(FOLDER, str(registry))
+    assert retrieved == [f"https://dropbox.test{FOLDER}/file1.nd2?dl=1"]
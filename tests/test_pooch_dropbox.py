@@ -1,2 +1,222 @@
+import hashlib
+import io
+import mmap
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import ModuleType, SimpleNamespace
+from typing import Any, Callable, Iterator
+
+import pytest
+
+from pooch_dropbox import _dropbox_content_hasher, db_content_hash
+from pooch_dropbox._dbx import _download_hash
+from pooch_dropbox._dropbox_content_hasher import (
+    BLOCK_SIZE,
+    DropboxContentHasher,
+    StreamHasher,
+    _dual_hash,
+    _empty_sha256,
+    _sha256_factory,
+)
+
+
+def _reference_hash(data: bytes, block_size: int = BLOCK_SIZE) -> str:
+    """The algorithm described at dropbox.com/developers/reference/content-hash."""
+    blocks = [data[i : i + block_size] for i in range(0, len(data), block_size)]
+    digests = b"".join(hashlib.sha256(b).digest() for b in blocks)
+    return hashlib.sha256(digests).hexdigest()
+
+
+class _SmallBlockHasher(DropboxContentHasher):
+    BLOCK_SIZE = 16
+
+
 def test_something():
     pass
+
+
+@pytest.mark.parametrize("size", [0, 1, 15, 16, 17, 32, 100])
+@pytest.mark.parametrize("chunk", [1, 7, 16, 33])
+def test_hasher_chunking(size: int, chunk: int) -> None:
+    data = os.urandom(size)
+    hasher = _SmallBlockHasher()
+    for i in range(0, size, chunk):
+        hasher.update(data[i : i + chunk])
+    assert hasher.hexdigest() == _reference_hash(data, _SmallBlockHasher.BLOCK_SIZE)
+
+
+def test_hasher_single_use() -> None:
+    hasher = DropboxContentHasher()
+    hasher.update(b"data")
+    hasher.digest()
+    with pytest.raises(RuntimeError):
+        hasher.update(b"more")
+    with pytest.raises(RuntimeError):
+        hasher.hexdigest()
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+@pytest.mark.parametrize("size", [0, 10, BLOCK_SIZE, 2 * BLOCK_SIZE + 10])
+def test_db_content_hash(tmp_path: Path, size: int, max_workers: int) -> None:
+    data = os.urandom(size)
+    path = tmp_path / "file.bin"
+    path.write_bytes(data)
+    assert db_content_hash(path, max_workers=max_workers) == _reference_hash(data)
+
+
+def test_db_content_hash_file_object(tmp_path: Path) -> None:
+    data = os.urandom(BLOCK_SIZE + 10)
+    path = tmp_path / "file.bin"
+    path.write_bytes(data)
+    with open(path, "rb") as f:
+        assert db_content_hash(f) == _reference_hash(data)
+
+
+@pytest.mark.parametrize("size", [0, 10, 2 * BLOCK_SIZE + 10])
+def test_dual_hash(tmp_path: Path, size: int) -> None:
+    data = os.urandom(size)
+    path = tmp_path / "file.bin"
+    path.write_bytes(data)
+    expected = (_reference_hash(data), hashlib.sha256(data).hexdigest())
+    assert _dual_hash(path) == expected
+
+
+def _unmappable_zero_size(monkeypatch: pytest.MonkeyPatch) -> None:
+    # like files in procfs, which report a size of 0 but have content
+    monkeypatch.setattr(os, "fstat", lambda fd: SimpleNamespace(st_size=0))
+
+
+def _unmappable_mmap_fails(monkeypatch: pytest.MonkeyPatch) -> None:
+    def _raise(*args: Any, **kwargs: Any) -> None:
+        raise OSError("mmap not supported")
+
+    monkeypatch.setattr(mmap, "mmap", _raise)
+
+
+@pytest.mark.parametrize(
+    "make_unmappable", [_unmappable_zero_size, _unmappable_mmap_fails]
+)
+def test_unmappable_file(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    make_unmappable: Callable[[pytest.MonkeyPatch], None],
+) -> None:
+    data = os.urandom(BLOCK_SIZE + 10)
+    path = tmp_path / "file.bin"
+    path.write_bytes(data)
+    make_unmappable(monkeypatch)
+    assert db_content_hash(path) == _reference_hash(data)
+    assert _dual_hash(path) == (_reference_hash(data), hashlib.sha256(data).hexdigest())
+
+
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="requires named pipes")
+def test_db_content_hash_pipe(tmp_path: Path) -> None:
+    data = os.urandom(BLOCK_SIZE + 10)
+    path = tmp_path / "pipe"
+    os.mkfifo(path)
+
+    def _write() -> None:
+        with open(path, "wb") as f:
+            f.write(data)
+
+    thread = threading.Thread(target=_write)
+    thread.start()
+    assert db_content_hash(path) == _reference_hash(data)
+    thread.join()
+
+
+def test_stream_hasher_readlines() -> None:
+    data = b"line 1\nline 2\nline 3\n"
+    hasher = hashlib.sha256()
+    lines = StreamHasher(io.BytesIO(data), hasher).readlines()
+    assert lines == data.splitlines(keepends=True)
+    assert hasher.hexdigest() == hashlib.sha256(data).hexdigest()
+
+
+def test_db_content_hash_chunksize(tmp_path: Path) -> None:
+    data = os.urandom(BLOCK_SIZE + 10)
+    path = tmp_path / "file.bin"
+    path.write_bytes(data)
+    assert db_content_hash(path, 1024) == _reference_hash(data)
+    with open(path, "rb") as f:
+        assert db_content_hash(f, 1000) == _reference_hash(data)
+    with pytest.raises(TypeError):
+        db_content_hash(path, 1024, 4)  # type: ignore[misc]
+
+
+@pytest.fixture
+def reset_sha256_factory(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    monkeypatch.setattr(_dropbox_content_hasher, "_picked_sha256_factory", None)
+    _empty_sha256.cache_clear()
+    yield
+    _empty_sha256.cache_clear()
+
+
+def test_sha256_factory_picked_once(
+    monkeypatch: pytest.MonkeyPatch, reset_sha256_factory: None
+) -> None:
+    picks = []
+
+    def _pick() -> Any:
+        picks.append(1)
+        time.sleep(0.05)
+        return hashlib.sha256
+
+    monkeypatch.setattr(_dropbox_content_hasher, "_pick_sha256_factory", _pick)
+    with ThreadPoolExecutor(8) as pool:
+        factories = list(pool.map(lambda _: _sha256_factory(), range(8)))
+    assert factories == [hashlib.sha256] * 8
+    assert len(picks) == 1
+
+
+def test_slow_hashlib_uses_pycryptodome(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, reset_sha256_factory: None
+) -> None:
+    data = os.urandom(2 * BLOCK_SIZE + 10)
+    path = tmp_path / "file.bin"
+    path.write_bytes(data)
+    expected = (_reference_hash(data), hashlib.sha256(data).hexdigest())
+
+    real_sha256 = hashlib.sha256
+    calls = []
+
+    def _slow_sha256(data: bytes = b"") -> Any:
+        # like an OpenSSL build without SHA-NI: ~100 MB/s
+        time.sleep(len(data) / 100e6)
+        return real_sha256(data)
+
+    def _crypto_sha256(data: bytes = b"") -> Any:
+        calls.append(len(data))
+        return real_sha256(data)
+
+    crypto_hash = ModuleType("Crypto.Hash")
+    crypto_hash.SHA256 = SimpleNamespace(new=_crypto_sha256)  # type: ignore
+    monkeypatch.setitem(sys.modules, "Crypto", ModuleType("Crypto"))
+    monkeypatch.setitem(sys.modules, "Crypto.Hash", crypto_hash)
+    monkeypatch.setattr(hashlib, "sha256", _slow_sha256)
+
+    # the backend is only picked on first use
+    assert _sha256_factory() is _crypto_sha256
+    calls.clear()
+    assert db_content_hash(path) == expected[0]
+    assert db_content_hash(path, max_workers=1) == expected[0]
+    assert _dual_hash(path) == expected
+    hasher = DropboxContentHasher()
+    for i in range(0, len(data), 1000):
+        hasher.update(data[i : i + 1000])
+    assert hasher.hexdigest() == expected[0]
+    assert calls
+
+    class _Response(io.BytesIO):
+        def iter_content(self, chunk_size: int) -> Iterator[bytes]:
+            return iter(lambda: self.read(chunk_size), b"")
+
+    dbx = SimpleNamespace(files_download=lambda path: (None, _Response(data)))
+    calls.clear()
+    assert _download_hash(dbx, "/file.bin") == expected  # type: ignore
+    # one for the pooch hash, and one for each whole block
+    assert len(calls) == 3